@@ -1,6 +1,10 @@
 # Stupid wrapper for `globus-cli` to load cesm files from NCAR server.
 # Assumes you've already logged in to globus from shell with `globus login`
 #
+# All variables go in a single transfer, and we poll until each variable has
+# arrived. Rerunning only moves files that are missing or changed. Use
+# `--backend local` to copy from a locally-mounted archive instead of globus.
+#
 # Can run from Bash with:
 #
 # python download_icesm.py \
@@ -14,10 +18,20 @@ import pathlib
 import subprocess
 import argparse
 import logging
+import collections
+import concurrent.futures
+import hashlib
+import json
+import shutil
+import time
 
 
 log = logging.getLogger(__name__)
 
+ARCHIVE_ROOT = '/gpfs/csfs1/univ/uazn0013/jiangzhu/archive'
+
+TransferItem = collections.namedtuple('TransferItem', ['variable', 'from_dir', 'to_dir'])
+
 
 def globus_find_endpoint(searchname, owner_id):
     """Get globus endpoint ID based on name and owner_id.
@@ -52,57 +66,332 @@ def globus_find_endpoint(searchname, owner_id):
     return endpoint_id
 
 
-def globus_transfer(from_endpoint, from_dir, to_endpoint, to_dir, task_label=None):
-    """Globus transfer from 'from' endpoint and dir to 'to endpoint and dir.
+def file_md5(path, blocksize=2**20):
+    """Get hex MD5 checksum of file at path.
+    """
+    h = hashlib.md5()
+    with open(str(path), 'rb') as fl:
+        for block in iter(lambda: fl.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
 
-    Assumes you've alread run `globus login`.
+def same_file(src, dst):
+    """Are files at src and dst both present with matching size and checksum?
+    """
+    src = pathlib.Path(src)
+    dst = pathlib.Path(dst)
+    if not dst.is_file() or src.stat().st_size != dst.stat().st_size:
+        return False
+    return file_md5(src) == file_md5(dst)
+
+
+def icesm_transfer_items(casename, download_path, atm_variables, ocn_variables,
+                         archive_root=ARCHIVE_ROOT):
+    """Get TransferItems for iCESM CAM and POP monthly timeseries variables.
 
     Parameters
     ----------
-    from_endpoint : str
-        Globus ID of endpoint containing data to transfer.
-    from_dir : str
-        Path to directory on 'from' endpoint containing all the data we will 
-        transfer.
-    to_endpoint : str
-        Globus ID of endpoint we want to transfer data to.
-    to_dir : str
-        Path to directory on 'to' endpoint we want to transfer data into.
-    task_label : str or None
-        Optional str label to give globus transfer task.
-
-
-    Examples
-    --------
-    > # in shell before, run `globus login`
-    > from_d = '/gpfs/csfs1/univ/uazn0013/jiangzhu/archive/b.e12.B1850C5.f19_g16.i21ka.03/atm/proc/tseries/monthly/PS/'
-    > to_d = '/xdisk/malevich/'
-    > tranfer(from_d, to_d)
+    casename : str
+        iCESM experiment case name.
+    download_path : str
+        Path we're transfering files to.
+    atm_variables : list of strs
+        CAM variables to transfer.
+    ocn_variables : list of strs
+        POP variables to transfer.
+    archive_root : str
+        Path to the iCESM case archives on the source side of the transfer.
+
+    Returns
+    -------
+    List of TransferItem, atmosphere variables first.
     """
-    from_endpoint = str(from_endpoint)
-    to_endpoint = str(to_endpoint)
+    from_template = '{}/{}/{}/proc/tseries/monthly/{}/'
+    items = []
+    for variable in atm_variables:
+        from_d = from_template.format(archive_root, casename, 'atm', variable)
+        items.append(TransferItem(variable, from_d, str(download_path)))
+    for variable in ocn_variables:
+        from_d = from_template.format(archive_root, casename, 'ocn', variable)
+        items.append(TransferItem(variable, from_d, str(download_path)))
+    return items
 
-    # In future might want to change `--format UNIX`, below, to something more
-    # machine-readable.
-    cmd_template = ["globus", "transfer", "--recursive", "--sync-level", "mtime",
-                    "{}:{}".format(from_endpoint, from_dir),
-                    "{}:{}".format(to_endpoint, to_dir),
-                    "--jq", "task_id", "--format", "UNIX"]
 
-    if task_label is not None:
-        cmd_template.append("--label")
-        cmd_template.append(str(task_label))
+class LocalTransfer:
+    """Filesystem transfer backend, copying files like ``rsync`` would.
 
-    subprocess.run(cmd_template, check=True,
-                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    log.debug('created globus transfer task from {}:{} to {}:{}'.format(
-        from_endpoint, from_dir, to_endpoint, to_dir))
+    Handy for testing, or when the archive is mounted on the same machine.
+    Files already at the destination with matching size and MD5 checksum are
+    skipped, so a rerun only copies what is missing or broken.
 
+    Copies run in this process, so they finish before the interpreter exits
+    even if you never call ``wait()``, and only ``wait()`` raises copy errors.
 
-def download_icesm(casename, download_path, atm_variables, ocn_variables):
-    """Start globus transfers of iCESM output from NCAR Campaign to UA HPC.
+    Parameters
+    ----------
+    max_workers : int
+        Number of variables to copy concurrently.
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = int(max_workers)
+
+    def submit(self, items, task_label=None):
+        """Start copying all transfer items, return a task handle.
+
+        Parameters
+        ----------
+        items : sequence of TransferItem
+            Variables to transfer, with source and destination directories.
+        task_label : str or None
+            Optional str label, only used for logging.
+
+        Returns
+        -------
+        Dict mapping each variable to a ``concurrent.futures.Future``.
+        """
+        log.debug('submitting local transfer {} with {} items'.format(
+            task_label, len(items)))
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers)
+        task = {x.variable: executor.submit(self._copy_dir, x.from_dir, x.to_dir)
+                for x in items}
+        executor.shutdown(wait=False)
+        return task
+
+    def wait(self, task, on_ready=None, poll_interval=1):
+        """Block until all variables in task are transferred.
+
+        Parameters
+        ----------
+        task : dict
+            Task handle returned by ``submit()``.
+        on_ready : callable or None
+            Called as ``on_ready(variable)`` as soon as each variable arrives.
+        poll_interval : float
+            Seconds between checks for finished variables.
+
+        Returns
+        -------
+        List of variable names, in the order they became ready.
+        """
+        ready = []
+        pending = dict(task)
+        while pending:
+            done, _ = concurrent.futures.wait(
+                list(pending.values()), timeout=poll_interval,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for variable in [k for k, v in pending.items() if v in done]:
+                # Raises here if the copy failed.
+                pending.pop(variable).result()
+                log.debug('variable {} ready'.format(variable))
+                ready.append(variable)
+                if on_ready is not None:
+                    on_ready(variable)
+        return ready
+
+    @staticmethod
+    def _copy_dir(from_dir, to_dir):
+        """Copy files under from_dir into to_dir, skipping matching files.
+        """
+        from_dir = pathlib.Path(from_dir)
+        to_dir = pathlib.Path(to_dir)
+        if not from_dir.is_dir():
+            raise FileNotFoundError('no source directory {}'.format(from_dir))
+        copied = []
+        for src in sorted(from_dir.rglob('*')):
+            if not src.is_file():
+                continue
+            dst = to_dir / src.relative_to(from_dir)
+            if same_file(src, dst):
+                log.debug('skipping {}, already at {}'.format(src, dst))
+                continue
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(str(src), str(dst))
+            copied.append(dst)
+        return copied
+
+
+class GlobusTransfer:
+    """Globus transfer backend, using the ``globus`` CLI.
+
+    All items are batched into a single globus transfer task. Globus
+    skips files already at the destination with a matching checksum.
+
+    Assumes you've already run `globus login`.
 
-    You should have run `globus login` from shell terminal before using this command.
+    Parameters
+    ----------
+    from_endpoint : str
+        Globus ID of endpoint containing data to transfer.
+    to_endpoint : str
+        Globus ID of endpoint we want to transfer data to.
+    sync_level : str
+        Globus ``--sync-level`` used to skip files already transferred.
+    max_workers : int
+        Number of concurrent ``globus ls`` calls when listing source files.
+    """
+    def __init__(self, from_endpoint, to_endpoint, sync_level='checksum', max_workers=4):
+        self.from_endpoint = str(from_endpoint)
+        self.to_endpoint = str(to_endpoint)
+        self.sync_level = str(sync_level)
+        self.max_workers = int(max_workers)
+
+    def submit(self, items, task_label=None):
+        """Submit one globus transfer task for all items, return a task handle.
+
+        Parameters
+        ----------
+        items : sequence of TransferItem
+            Variables to transfer, with source and destination directories.
+        task_label : str or None
+            Optional str label to give globus transfer task.
+
+        Returns
+        -------
+        Dict with the globus task ID, the items it transfers, the source file
+        paths for each variable and the source paths of files already at the
+        destination.
+        """
+        items = list(items)
+        to_dirs = sorted(set(x.to_dir for x in items))
+        # List before submitting, so we see the destination as globus found it.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            files = dict(zip([x.variable for x in items],
+                             executor.map(self._source_files, items)))
+            dest_files = set().union(*executor.map(self._dest_files, to_dirs))
+        # Only these can be skipped by globus for the sync level.
+        present = set()
+        for x in items:
+            for f in files[x.variable]:
+                rel = os.path.relpath(f, x.from_dir)
+                if os.path.normpath(os.path.join(x.to_dir, rel)) in dest_files:
+                    present.add(f)
+
+        batch = '\n'.join('--recursive {} {}'.format(x.from_dir, x.to_dir)
+                           for x in items)
+        cmd_template = ["globus", "transfer", self.from_endpoint, self.to_endpoint,
+                        "--batch", "-", "--sync-level", self.sync_level,
+                        "--jq", "task_id", "--format", "UNIX"]
+        if task_label is not None:
+            cmd_template.append("--label")
+            cmd_template.append(str(task_label))
+
+        response = subprocess.run(cmd_template, check=True, input=batch.encode('utf-8'),
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        task_id = response.stdout.rstrip().decode('utf-8')
+        log.debug('created globus transfer task {} with {} items'.format(
+            task_id, len(items)))
+        return {'task_id': task_id, 'items': items, 'files': files, 'present': present}
+
+    def wait(self, task, on_ready=None, poll_interval=60):
+        """Poll globus task until done, noting variables as they arrive.
+
+        A variable is ready once all its source files are done. A file is done
+        when globus lists it as successfully transferred. Globus only counts the
+        files it skips for the sync level, without naming them. Only files
+        already at the destination when the task was submitted can be skipped,
+        so once the skipped count matches the number of those not transferred,
+        they are all done too.
+
+        Parameters
+        ----------
+        task : dict
+            Task handle returned by ``submit()``.
+        on_ready : callable or None
+            Called as ``on_ready(variable)`` as soon as each variable arrives.
+        poll_interval : float
+            Seconds between polls of the globus task.
+
+        Returns
+        -------
+        List of variable names, in the order they became ready.
+        """
+        task_id = task['task_id']
+        ready = []
+        pending = [x.variable for x in task['items']]
+        while pending:
+            detail = self._task_detail(task_id)
+            status = detail['status']
+            if status == 'FAILED':
+                raise RuntimeError('globus task {} failed'.format(task_id))
+            if status == 'INACTIVE':
+                # Paused, usually for expired credentials. Resumes once reactivated.
+                log.warning('globus task {} is paused, reactivate it to resume'.format(
+                    task_id))
+
+            if status == 'SUCCEEDED':
+                done = set().union(*task['files'].values())
+            else:
+                done = self._successful_transfers(task_id)
+                maybe_skipped = task['present'] - done
+                if detail['files_skipped'] == len(maybe_skipped):
+                    done |= maybe_skipped
+
+            for variable in list(pending):
+                if task['files'][variable] <= done:
+                    pending.remove(variable)
+                    log.debug('variable {} ready'.format(variable))
+                    ready.append(variable)
+                    if on_ready is not None:
+                        on_ready(variable)
+
+            if pending:
+                time.sleep(poll_interval)
+        return ready
+
+    def _task_detail(self, task_id):
+        cmd_template = ["globus", "task", "show", task_id, "--format", "JSON"]
+        response = subprocess.run(cmd_template, check=True,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return json.loads(response.stdout.decode('utf-8'))
+
+    def _successful_transfers(self, task_id):
+        """Get set of source paths globus has finished transferring in task
+        """
+        cmd_template = ["globus", "task", "show", task_id, "--successful-transfers",
+                        "--format", "JSON"]
+        response = subprocess.run(cmd_template, check=True,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        data = json.loads(response.stdout.decode('utf-8'))
+        return {os.path.normpath(x['source_path']) for x in data.get('DATA', [])}
+
+    def _dest_files(self, to_dir):
+        """Get set of file paths already under to_dir on the destination endpoint
+        """
+        try:
+            data = self._ls(self.to_endpoint, to_dir)
+        except subprocess.CalledProcessError:
+            # Likely doesn't exist yet. Then nothing can be skipped.
+            log.debug('could not list {}:{}'.format(self.to_endpoint, to_dir))
+            return set()
+        return {os.path.normpath(os.path.join(to_dir, x['name']))
+                for x in data.get('DATA', []) if x.get('type') == 'file'}
+
+    def _source_files(self, item):
+        """Get set of file paths under item's source dir
+        """
+        data = self._ls(self.from_endpoint, item.from_dir)
+        return {os.path.normpath(os.path.join(item.from_dir, x['name']))
+                for x in data.get('DATA', []) if x.get('type') == 'file'}
+
+    @staticmethod
+    def _ls(endpoint, path):
+        cmd_template = ["globus", "ls", "--recursive", "{}:{}".format(endpoint, path),
+                        "--format", "JSON"]
+        response = subprocess.run(cmd_template, check=True,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return json.loads(response.stdout.decode('utf-8'))
+
+
+def download_icesm(casename, download_path, atm_variables, ocn_variables,
+                   backend=None, archive_root=ARCHIVE_ROOT, on_ready=None,
+                   wait=True, poll_interval=60):
+    """Transfer iCESM output from NCAR Campaign to UA HPC.
+
+    All variables go into a single transfer submission. By default this
+    uses globus, so you should have run `globus login` from shell terminal
+    before using this command.
 
     Parameters
     ----------
@@ -112,47 +401,83 @@ def download_icesm(casename, download_path, atm_variables, ocn_variables):
         UA HPC path we're transfering files to. Should be able to handle lots of data.
         Path must already exist.
     atm_variables : list of strs
+        CAM variables to transfer.
+    ocn_variables : list of strs
+        POP variables to transfer.
+    backend : GlobusTransfer, LocalTransfer or None
+        Transfer backend. If `None`, uses ``GlobusTransfer`` between the NCAR
+        Campaign Storage and UA HPC endpoints.
+    archive_root : str
+        Path to the iCESM case archives on the source side of the transfer.
+    on_ready : callable or None
+        Called as ``on_ready(variable)`` as soon as each variable arrives.
+        Only used if `wait`.
+    wait : bool
+        Block and poll until all variables have arrived?
+    poll_interval : float
+        Seconds between polls for transfer completion.
 
+    Returns
+    -------
+    List of variable names that have arrived, in order, if `wait`.
+    Otherwise the backend's task handle.
     """
-    log.debug('begin creating globus transfers for {} to {}'.format(
+    log.debug('begin creating transfers for {} to {}'.format(
         casename, download_path))
-    ncar_endpoint = globus_find_endpoint(
-        searchname='NCAR Campaign Storage', owner_id='ncar@globusid.org')
-    uahpc_endpoint = globus_find_endpoint(
-        searchname='arizona#sdmz-dtn', owner_id='tmerritt@arizona.edu')
+    if backend is None:
+        ncar_endpoint = globus_find_endpoint(
+            searchname='NCAR Campaign Storage', owner_id='ncar@globusid.org')
+        uahpc_endpoint = globus_find_endpoint(
+            searchname='arizona#sdmz-dtn', owner_id='tmerritt@arizona.edu')
+
+        assert ncar_endpoint is not None and uahpc_endpoint is not None, 'could not get globus endpoint IDs'
+
+        backend = GlobusTransfer(from_endpoint=ncar_endpoint,
+                                 to_endpoint=uahpc_endpoint)
 
-    assert ncar_endpoint is not None or uahpc_endpoint is not None, 'could not get globus endpoint IDs'
+    items = icesm_transfer_items(casename=casename, download_path=download_path,
+                                 atm_variables=atm_variables,
+                                 ocn_variables=ocn_variables,
+                                 archive_root=archive_root)
 
     lab = 'download_icesm_py'
-    # Load files from atmosphere component
-    from_atm_template = '/gpfs/csfs1/univ/uazn0013/jiangzhu/archive/{}/atm/proc/tseries/monthly/{}/'
-    for variable in atm_variables:
-        from_d = from_atm_template.format(casename, variable)
-        globus_transfer(from_endpoint=ncar_endpoint, from_dir=from_d,
-                        to_endpoint=uahpc_endpoint, to_dir=download_path, task_label=lab)
+    task = backend.submit(items, task_label=lab)
+    log.debug('transfers created')
 
-    # Load files from ocean component
-    from_ocn_template = '/gpfs/csfs1/univ/uazn0013/jiangzhu/archive/{}/ocn/proc/tseries/monthly/{}/'
-    for variable in ocn_variables:
-        from_d = from_ocn_template.format(casename, variable)
-        globus_transfer(from_endpoint=ncar_endpoint, from_dir=from_d,
-                        to_endpoint=uahpc_endpoint, to_dir=download_path, task_label=lab)
-    log.debug('globus transfers created')
+    if not wait:
+        return task
+
+    ready = backend.wait(task, on_ready=on_ready, poll_interval=poll_interval)
+    log.debug('transfers complete')
+    return ready
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
-        description='Globus transfer iCESM files from NCAR to UA HPC')
+        description='Transfer iCESM files from NCAR to UA HPC')
     parser.add_argument('--casename', metavar='CASENAME', nargs=1,
                         default=['b.e12.B1850C5.f19_g16.i21ka.03'],
                         help='iCESM experiment case name')
     parser.add_argument('--downloadpath', metavar='DOWNLOADPATH', nargs=1,
                         default=[None],
                         help='directory files will be transferred to. PWD is default. Will be created if it doesnt exist.')
+    parser.add_argument('--backend', metavar='BACKEND', nargs=1,
+                        default=['globus'], choices=['globus', 'local'],
+                        help='transfer backend, "globus" (default) or "local" filesystem copy.')
+    parser.add_argument('--archiveroot', metavar='ARCHIVEROOT', nargs=1,
+                        default=[ARCHIVE_ROOT],
+                        help='path to iCESM case archives on the source side of the transfer')
+    parser.add_argument('--workers', metavar='WORKERS', nargs=1, type=int, default=[4],
+                        help='number of concurrent copies for "local" backend')
+    parser.add_argument('--nowait', action='store_true',
+                        help='submit transfers and exit without polling for completion. Only for "globus" backend')
     parser.add_argument('--log', metavar='LOGPATH', nargs=1, default=[None],
                         help='file path that log will be written to')
     args = parser.parse_args()
 
+    if args.nowait and args.backend[0] == 'local':
+        parser.error('--nowait only works with the "globus" backend')
+
     if args.log[0] is not None:
         logging.basicConfig(level=logging.DEBUG,
                             filename=args.log[0],
@@ -197,5 +522,13 @@ if __name__ == '__main__':
                      'SALT',
                      ]
 
+    if args.backend[0] == 'local':
+        backend = LocalTransfer(max_workers=args.workers[0])
+    else:
+        backend = None
+
     download_icesm(casename=casename, download_path=dl_path,
-                   atm_variables=atm_variables, ocn_variables=ocn_variables)
+                   atm_variables=atm_variables, ocn_variables=ocn_variables,
+                   backend=backend, archive_root=args.archiveroot[0],
+                   on_ready=lambda v: log.info('{} ready'.format(v)),
+                   wait=not args.nowait)
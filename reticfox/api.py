@@ -7,6 +7,9 @@ import gsw
 
 log = logging.getLogger(__name__)
 
+# Dimension of POP ocean points compressed by gathering.
+GATHER_DIM = 'wetpoint'
+
 
 def pot2insitu_temp(theta, salt, insitu_temp_name='insitu_temp'):
     """Get insitu temp DataArray from potential temperature (theta) and salinity (salt) dataset
@@ -16,7 +19,11 @@ def pot2insitu_temp(theta, salt, insitu_temp_name='insitu_temp'):
     # Convert depth (cm) to (m) & positive up.
     # sea pressure (dbar) from depth (m), note it needs latitude as input,
     # unlike ferret and NCL functions.
-    p = xr.apply_ufunc(gsw.p_from_z, -theta.z_t * 0.01, theta.TLAT,
+    lat = theta.TLAT
+    if GATHER_DIM in theta.dims and GATHER_DIM not in lat.dims:
+        # TLAT stays 2D in gathered datasets.
+        lat = _gather(xr.DataArray(lat.variable), theta[GATHER_DIM], theta.sizes['nlon'])
+    p = xr.apply_ufunc(gsw.p_from_z, -theta.z_t * 0.01, lat,
                        output_dtypes=['float32'], dask='parallelized')
 
     insitu_temp = xr.apply_ufunc(gsw.pt_from_t, salt.SALT, theta.TEMP, np.array([0]), p,
@@ -67,3 +74,102 @@ def tex86_gammaavg_depth(ds, target_var='TEMP', gatemp_name='toga'):
     temp_gamma_avg.attrs['long_name'] = 'Sea Temperature (Gamma-average)'
 
     return temp_gamma_avg
+
+
+def ocean_gather_index(kmt, gather_dim=GATHER_DIM):
+    """Get CF "compression by gathering" index of wet POP grid points from KMT
+
+    Returns a 1D int DataArray of 0-based indices into the flattened
+    (nlat, nlon) grid, for points where ``kmt > 0``. Works on a boolean ocean
+    mask as well.
+    """
+    # KMT may have picked up a time dimension from ``open_mfdataset()``.
+    kmt = kmt.isel({d: 0 for d in kmt.dims if d not in ('nlat', 'nlon')})
+    kmt = kmt.transpose('nlat', 'nlon')
+    idx = np.flatnonzero(np.asarray(kmt.values > 0)).astype('int32')
+
+    gather_index = xr.DataArray(idx, coords=[idx], dims=[gather_dim], name=gather_dim)
+    gather_index.attrs['compress'] = 'nlat nlon'
+    gather_index.attrs['long_name'] = 'wet ocean grid points'
+    return gather_index
+
+
+def _is_ocean_grid(v):
+    """Is variable v only on the horizontal (nlat, nlon) grid, like TLAT or KMT?
+    """
+    return len(v.dims) > 0 and set(v.dims) <= {'nlat', 'nlon'}
+
+
+def _gather(obj, gather_index, nlon):
+    """Pull gathered points out of (nlat, nlon) dims in obj
+    """
+    gather_dim = gather_index.dims[0]
+    idx = gather_index.values
+    out = obj.isel(nlat=xr.DataArray(idx // nlon, dims=[gather_dim]),
+                   nlon=xr.DataArray(idx % nlon, dims=[gather_dim]))
+    # CF list variable of gathered points, as a coordinate.
+    out.coords[gather_dim] = gather_index
+    return out
+
+
+def attach_ocean_grid(ds, source):
+    """Copy 2D (nlat, nlon) grid coordinates, like TLAT, from source onto ds
+
+    Selecting variables out of a gathered Dataset drops the grid, which is
+    needed to write CF-compliant files and to scatter back to 2D.
+    """
+    coords = {k: source.variables[k] for k in source.coords
+              if _is_ocean_grid(source.variables[k])}
+    return ds.assign_coords(coords)
+
+
+def gather_ocean(ds, gather_index):
+    """Compress (nlat, nlon) variables in POP Dataset to gathered 1D wet points
+
+    Variables only on the horizontal grid, like TLAT or KMT, are left as 2D
+    and ``nlat``, ``nlon`` index coordinates are added, so the dimensions
+    named in the CF ``compress`` attribute stay in the Dataset. Other
+    variables pass through untouched. Use ``scatter_ocean()`` to go back to
+    the full 2D grid.
+    """
+    grid = [k for k, v in ds.variables.items() if _is_ocean_grid(v)]
+    nlat = ds.sizes['nlat']
+    nlon = ds.sizes['nlon']
+
+    out = _gather(ds.drop_vars(grid), gather_index, nlon)
+    out = out.assign_coords(nlat=np.arange(nlat), nlon=np.arange(nlon))
+    for k in grid:
+        if k in ds.coords:
+            out.coords[k] = ds.variables[k]
+        else:
+            out[k] = ds.variables[k]
+    return out
+
+
+def scatter_ocean(ds, gather_dim=GATHER_DIM):
+    """Expand gathered POP Dataset back to the full (nlat, nlon) grid
+
+    Land points are filled with NaN. 2D grid variables are passed through
+    as they are.
+    """
+    nlat = ds.sizes['nlat']
+    nlon = ds.sizes['nlon']
+    grid = [k for k, v in ds.variables.items() if _is_ocean_grid(v)]
+
+    full = (ds.drop_vars(grid)
+            .reindex({gather_dim: np.arange(nlat * nlon)})
+            .drop_vars(gather_dim))
+    jj, ii = np.divmod(np.arange(nlat * nlon), nlon)
+    full = (full.assign_coords(nlat=(gather_dim, jj), nlon=(gather_dim, ii))
+            .set_index({gather_dim: ['nlat', 'nlon']})
+            .unstack(gather_dim))
+    # POP files have no nlat, nlon coordinate values.
+    full = full.drop_vars(['nlat', 'nlon'])
+    for k in grid:
+        if k in ('nlat', 'nlon'):
+            continue
+        if k in ds.coords:
+            full.coords[k] = ds.variables[k]
+        else:
+            full[k] = ds.variables[k]
+    return full
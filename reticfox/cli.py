@@ -243,7 +243,9 @@ def make_ts(ts_glob, ts_str, outfl=None):
 @click.option('--outfl', help='Path for output NetCDF file.')
 @click.option('--time_chunks', default=5, help='Number of time steps in each input files chunk.')
 @click.option('--mask_badsalt', is_flag=True, help='Mask-out negative SALT values with NAs?')
-def make_tos(temp_glob, salt_glob, tos_str, outfl=None, time_chunks=5, mask_badsalt=True):
+@click.option('--gather', is_flag=True, help='Store only wet ocean points, compressed by gathering on KMT?')
+def make_tos(temp_glob, salt_glob, tos_str, outfl=None, time_chunks=5, mask_badsalt=True,
+             gather=False):
     """Parse POP TEMP iCESM NetCDF files
     """
     top_level = 500.0  # highest ocean level in iCESM (cm)
@@ -254,6 +256,11 @@ def make_tos(temp_glob, salt_glob, tos_str, outfl=None, time_chunks=5, mask_bads
     salt = xr.open_mfdataset(salt_glob, chunks={'time': time_chunks}).sel(
         z_t=top_level).sortby('time')
 
+    if gather:
+        wet = api.ocean_gather_index(theta['KMT'])
+        theta = api.gather_ocean(theta, wet)
+        salt = api.gather_ocean(salt, wet)
+
     if mask_badsalt:
         salt['SALT'] = salt['SALT'].where(salt['SALT'] > 0)
 
@@ -261,6 +268,8 @@ def make_tos(temp_glob, salt_glob, tos_str, outfl=None, time_chunks=5, mask_bads
         theta, salt, insitu_temp_name=tinsitu_str)
 
     out = theta[[tinsitu_str, 'time_bound']].rename({tinsitu_str: tos_str})
+    if gather:
+        out = api.attach_ocean_grid(out, theta)
     if outfl is not None:
         # Write ~SST file
         out.to_netcdf(outfl, format='NETCDF4', engine='netcdf4')
@@ -273,7 +282,9 @@ def make_tos(temp_glob, salt_glob, tos_str, outfl=None, time_chunks=5, mask_bads
 @click.option('--outfl', help='Path for output NetCDF file.')
 @click.option('--time_chunks', default=5, help='Number of time steps in each input files chunk.')
 @click.option('--mask_badsalt', is_flag=True, help='Mask-out negative SALT values with NAs?')
-def make_sos(salt_glob, sos_str, outfl=None, time_chunks=5, mask_badsalt=True):
+@click.option('--gather', is_flag=True, help='Store only wet ocean points, compressed by gathering on KMT?')
+def make_sos(salt_glob, sos_str, outfl=None, time_chunks=5, mask_badsalt=True,
+             gather=False):
     """Parse POP SALT iCESM NetCDF files
     """
     top_level = 500.0  # highest ocean level in iCESM (cm)
@@ -282,10 +293,15 @@ def make_sos(salt_glob, sos_str, outfl=None, time_chunks=5, mask_badsalt=True):
             .sel(z_t=top_level)
             .sortby('time'))
 
+    if gather:
+        salt = api.gather_ocean(salt, api.ocean_gather_index(salt['KMT']))
+
     if mask_badsalt:
         salt['SALT'] = salt['SALT'].where(salt['SALT'] > 0)
 
     out = salt[['SALT', 'time_bound']].rename({'SALT': sos_str})
+    if gather:
+        out = api.attach_ocean_grid(out, salt)
     if outfl is not None:
         out.to_netcdf(outfl, format='NETCDF4', engine='netcdf4')
     return out
@@ -298,8 +314,9 @@ def make_sos(salt_glob, sos_str, outfl=None, time_chunks=5, mask_badsalt=True):
 @click.option('--outfl', help='Path for output NetCDF file.')
 @click.option('--time_chunks', default=5, help='Number of time steps in each input files chunk.')
 @click.option('--mask_badsalt', is_flag=True, help='Mask-out negative SALT values with NAs?')
+@click.option('--gather', is_flag=True, help='Store only wet ocean points, compressed by gathering on KMT?')
 def make_toga(temp_glob, salt_glob, toga_str, outfl=None, time_chunks=5,
-              mask_badsalt=True):
+              mask_badsalt=True, gather=False):
     """Parse POP TEMP and SALT iCESM NetCDF files for gamma-average insitu temp
     """
     cutoff_z = 20000
@@ -309,6 +326,11 @@ def make_toga(temp_glob, salt_glob, toga_str, outfl=None, time_chunks=5,
     salt = xr.open_mfdataset(salt_glob, chunks={'time': time_chunks}).sel(
         z_t=slice(0, cutoff_z)).sortby('time')
 
+    if gather:
+        wet = api.ocean_gather_index(theta['KMT'])
+        theta = api.gather_ocean(theta, wet)
+        salt = api.gather_ocean(salt, wet)
+
     if mask_badsalt:
         salt['SALT'] = salt['SALT'].where(salt['SALT'] > 0)
 
@@ -328,6 +350,8 @@ def make_toga(temp_glob, salt_glob, toga_str, outfl=None, time_chunks=5,
 
     out = theta[[toga_str, 'time_bound']]
     out[toga_str] = out[toga_str].astype('float32')
+    if gather:
+        out = api.attach_ocean_grid(out, theta)
     if outfl is not None:
         # Write gamma-average file
         out.to_netcdf(outfl, format='NETCDF4', engine='netcdf4')
@@ -341,7 +365,9 @@ def make_toga(temp_glob, salt_glob, toga_str, outfl=None, time_chunks=5,
 @click.option('--time_chunks', default=5, help='Number of time steps in each input files chunk.')
 @click.option('--bad_sos_glob', default='NONE', help='Glob pattern to input surface NetCDF files, to mask subzero salinity.')
 @click.option('--sos_str', default='sos', help='Surface salinity variable name in `bad_sos_glob`s.')
-def make_d18osw(r18o_glob, d18osw_str, outfl=None, time_chunks=5, bad_sos_glob=None, sos_str='sos'):
+@click.option('--gather', is_flag=True, help='Store only wet ocean points, compressed by gathering on KMT?')
+def make_d18osw(r18o_glob, d18osw_str, outfl=None, time_chunks=5, bad_sos_glob=None, sos_str='sos',
+                gather=False):
     """Parse POP R18O iCESM netCDF files and write to outfl.
     """
     if bad_sos_glob.lower() == 'none':
@@ -351,12 +377,23 @@ def make_d18osw(r18o_glob, d18osw_str, outfl=None, time_chunks=5, bad_sos_glob=N
     r18o = (xr.open_mfdataset(r18o_glob, chunks={'time': time_chunks})
             .sel(z_t=top_level)
             .sortby('time'))
+
+    wet = None
+    if gather:
+        wet = api.ocean_gather_index(r18o['KMT'])
+        r18o = api.gather_ocean(r18o, wet)
+
     r18o[d18osw_str] = (r18o['R18O'] - 1.0) * 1000.0
 
     if bad_sos_glob is not None:
         # Read in and mask out grid points with subzero seawater salinity.
         sos = (xr.open_mfdataset(bad_sos_glob, chunks={'time': time_chunks})
                .sortby('time'))
+        # sos files may or may not already be gathered.
+        if wet is not None and api.GATHER_DIM not in sos.dims:
+            sos = api.gather_ocean(sos, wet)
+        elif wet is None and api.GATHER_DIM in sos.dims:
+            sos = api.scatter_ocean(sos)
         r18o[d18osw_str] = r18o[d18osw_str].where(sos[sos_str] > 0)
 
     # Metadata
@@ -365,6 +402,8 @@ def make_d18osw(r18o_glob, d18osw_str, outfl=None, time_chunks=5, bad_sos_glob=N
     r18o[d18osw_str].attrs['units'] = 'permil'
 
     out = r18o[[d18osw_str, 'time_bound']]
+    if gather:
+        out = api.attach_ocean_grid(out, r18o)
     if outfl is not None:
         # Dump to file
         # log.debug('Writing variable {} to {}'.format(d18osw_str, outfl))
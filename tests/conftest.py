@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+
+@pytest.fixture
+def pop_ds():
+    """Small synthetic POP-like Dataset with TEMP and SALT, NaN on land"""
+    nt, nz, nlat, nlon = 3, 2, 4, 5
+    rng = np.random.RandomState(42)
+    kmt = np.full((nlat, nlon), nz, dtype='int32')
+    kmt[0, :2] = 0
+    kmt[3, 4] = 0
+    kmt[2, 1] = 1
+    # Deeper levels below KMT are land too.
+    land = np.arange(nz)[:, None, None] >= kmt[None]
+
+    temp = rng.uniform(0, 25, (nt, nz, nlat, nlon)).astype('float32')
+    temp[:, land] = np.nan
+    salt = rng.uniform(30, 37, (nt, nz, nlat, nlon)).astype('float32')
+    salt[:, land] = np.nan
+
+    tlat, tlong = np.meshgrid(np.linspace(-60, 60, nlat), np.linspace(0, 300, nlon),
+                              indexing='ij')
+    ds = xr.Dataset(
+        {'TEMP': (('time', 'z_t', 'nlat', 'nlon'), temp),
+         'SALT': (('time', 'z_t', 'nlat', 'nlon'), salt),
+         'KMT': (('nlat', 'nlon'), kmt),
+         'time_bound': (('time', 'd2'), np.arange(nt * 2, dtype='float64').reshape(nt, 2))},
+        coords={'time': np.arange(nt, dtype='float64') + 0.5,
+                'z_t': np.array([500.0, 1500.0], dtype='float32'),
+                'TLAT': (('nlat', 'nlon'), tlat),
+                'TLONG': (('nlat', 'nlon'), tlong)})
+    ds['TEMP'].attrs['units'] = 'degC'
+    return ds
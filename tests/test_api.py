@@ -0,0 +1,61 @@
+import netCDF4
+import numpy as np
+import xarray as xr
+
+import reticfox.api as api
+
+
+def test_ocean_gather_index(pop_ds):
+    wet = api.ocean_gather_index(pop_ds['KMT'])
+    assert wet.dims == (api.GATHER_DIM,)
+    assert wet.attrs['compress'] == 'nlat nlon'
+    np.testing.assert_array_equal(wet.values, np.flatnonzero(pop_ds['KMT'].values > 0))
+
+
+def test_gather_ocean(pop_ds):
+    wet = api.ocean_gather_index(pop_ds['KMT'])
+    gathered = api.gather_ocean(pop_ds, wet)
+
+    assert gathered['TEMP'].dims == ('time', 'z_t', api.GATHER_DIM)
+    assert gathered.sizes[api.GATHER_DIM] == 17
+    # Grid stays 2D, and nlat, nlon are kept for CF "compress".
+    assert gathered['TLAT'].dims == ('nlat', 'nlon')
+    assert gathered['KMT'].dims == ('nlat', 'nlon')
+    assert gathered.sizes['nlat'] == 4
+    assert gathered.sizes['nlon'] == 5
+    j, i = np.divmod(wet.values, 5)
+    np.testing.assert_array_equal(gathered['TEMP'].values,
+                                  pop_ds['TEMP'].values[..., j, i])
+
+
+def test_gather_scatter_roundtrip(pop_ds):
+    wet = api.ocean_gather_index(pop_ds['KMT'])
+    actual = api.scatter_ocean(api.gather_ocean(pop_ds, wet))
+    xr.testing.assert_identical(actual, pop_ds)
+
+
+def test_gather_ocean_netcdf(pop_ds, tmp_path):
+    wet = api.ocean_gather_index(pop_ds['KMT'])
+    outfl = str(tmp_path / 'gathered.nc')
+    api.gather_ocean(pop_ds, wet).to_netcdf(outfl)
+
+    with netCDF4.Dataset(outfl) as nc:
+        assert {'nlat', 'nlon', api.GATHER_DIM} <= set(nc.dimensions)
+        assert nc[api.GATHER_DIM].compress == 'nlat nlon'
+        for d in nc[api.GATHER_DIM].compress.split():
+            assert d in nc.dimensions
+
+    with xr.open_dataset(outfl) as ds:
+        xr.testing.assert_identical(api.scatter_ocean(ds).load(), pop_ds)
+
+
+def test_pot2insitu_temp_gathered(pop_ds):
+    wet = api.ocean_gather_index(pop_ds['KMT'])
+    gathered = api.gather_ocean(pop_ds, wet)
+
+    expected = api.pot2insitu_temp(pop_ds, pop_ds)
+    actual = api.pot2insitu_temp(gathered, gathered)
+
+    assert actual.dims == ('time', 'z_t', api.GATHER_DIM)
+    j, i = np.divmod(wet.values, 5)
+    np.testing.assert_allclose(actual.values, expected.values[..., j, i])
@@ -0,0 +1,36 @@
+import pytest
+import xarray as xr
+
+pytest.importorskip('Ngl')
+
+import reticfox.api as api
+from reticfox.cli import make_sos, make_tos
+
+
+@pytest.fixture
+def pop_globs(pop_ds, tmp_path):
+    """Write synthetic POP TEMP, SALT files, return their paths"""
+    temp_fl = str(tmp_path / 'case.pop.h.TEMP.nc')
+    salt_fl = str(tmp_path / 'case.pop.h.SALT.nc')
+    pop_ds.drop_vars('SALT').to_netcdf(temp_fl)
+    pop_ds.drop_vars('TEMP').to_netcdf(salt_fl)
+    return temp_fl, salt_fl
+
+
+def test_make_sos_gather(pop_globs):
+    _, salt_glob = pop_globs
+    expected = make_sos.callback(salt_glob, 'sos', mask_badsalt=True).load()
+    actual = make_sos.callback(salt_glob, 'sos', mask_badsalt=True, gather=True).load()
+
+    assert actual['sos'].dims == ('time', api.GATHER_DIM)
+    xr.testing.assert_identical(api.scatter_ocean(actual), expected)
+
+
+def test_make_tos_gather(pop_globs):
+    temp_glob, salt_glob = pop_globs
+    expected = make_tos.callback(temp_glob, salt_glob, 'tos', mask_badsalt=True).load()
+    actual = make_tos.callback(temp_glob, salt_glob, 'tos', mask_badsalt=True,
+                               gather=True).load()
+
+    assert actual['tos'].dims == ('time', api.GATHER_DIM)
+    xr.testing.assert_allclose(api.scatter_ocean(actual), expected)
@@ -0,0 +1,169 @@
+import json
+import subprocess
+from unittest import mock
+
+import pytest
+
+import download_icesm
+
+
+ATM_VARIABLES = ['TS', 'PS']
+OCN_VARIABLES = ['SALT']
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Fake iCESM archive with one small file per variable"""
+    root = tmp_path / 'archive'
+    for component, variables in [('atm', ATM_VARIABLES), ('ocn', OCN_VARIABLES)]:
+        for v in variables:
+            d = root / 'case' / component / 'proc' / 'tseries' / 'monthly' / v
+            d.mkdir(parents=True)
+            (d / 'case.{}.nc'.format(v)).write_text(v * 3)
+    return root
+
+
+def test_download_icesm_local(archive, tmp_path):
+    dl_path = tmp_path / 'download'
+    dl_path.mkdir()
+    on_ready = mock.Mock()
+
+    ready = download_icesm.download_icesm(
+        'case', dl_path, ATM_VARIABLES, OCN_VARIABLES,
+        backend=download_icesm.LocalTransfer(max_workers=1),
+        archive_root=str(archive), on_ready=on_ready, poll_interval=0.1)
+
+    assert ready == ATM_VARIABLES + OCN_VARIABLES
+    assert [c[0][0] for c in on_ready.call_args_list] == ready
+    assert sorted(x.name for x in dl_path.iterdir()) == [
+        'case.PS.nc', 'case.SALT.nc', 'case.TS.nc']
+    assert (dl_path / 'case.TS.nc').read_text() == 'TSTSTS'
+
+
+def test_download_icesm_local_rerun(archive, tmp_path):
+    dl_path = tmp_path / 'download'
+    dl_path.mkdir()
+    backend = download_icesm.LocalTransfer(max_workers=2)
+    download_icesm.download_icesm('case', dl_path, ATM_VARIABLES, OCN_VARIABLES,
+                                  backend=backend, archive_root=str(archive))
+    # Same size, different checksum, so should be copied again.
+    (dl_path / 'case.PS.nc').write_text('XXXXXX')
+
+    with mock.patch.object(download_icesm.shutil, 'copy2',
+                           wraps=download_icesm.shutil.copy2) as copy2:
+        ready = download_icesm.download_icesm(
+            'case', dl_path, ATM_VARIABLES, OCN_VARIABLES,
+            backend=backend, archive_root=str(archive))
+
+    assert sorted(ready) == sorted(ATM_VARIABLES + OCN_VARIABLES)
+    assert [c[0][1] for c in copy2.call_args_list] == [str(dl_path / 'case.PS.nc')]
+    assert (dl_path / 'case.PS.nc').read_text() == 'PSPSPS'
+
+
+def test_download_icesm_local_missing(archive, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        download_icesm.download_icesm(
+            'case', tmp_path, ATM_VARIABLES + ['OMEGA'], OCN_VARIABLES,
+            backend=download_icesm.LocalTransfer(), archive_root=str(archive))
+
+
+def fake_globus(polls, dest_files=()):
+    """Fake `subprocess.run` for globus CLI
+
+    polls is a list of (status, files_skipped, transferred source paths),
+    one for each poll of the task. Popped as the task is polled.
+    """
+    calls = []
+    current = {}
+
+    def run(cmd, **kwargs):
+        calls.append(cmd)
+        assert cmd[0] == 'globus'
+        if cmd[1:3] == ['task', 'show'] and '--successful-transfers' in cmd:
+            out = json.dumps({'DATA': [{'source_path': x, 'destination_path': '/dl/x'}
+                                       for x in current['transferred']]})
+        elif cmd[1:3] == ['task', 'show']:
+            status, files_skipped, current['transferred'] = polls.pop(0)
+            out = json.dumps({'status': status, 'files_skipped': files_skipped})
+        elif cmd[1] == 'ls':
+            endpoint, path = cmd[3].split(':')
+            if endpoint == 'to-ep':
+                names = dest_files
+            else:
+                names = ['case.{}.nc'.format(path.rstrip('/').split('/')[-1])]
+            out = json.dumps({'DATA': [{'name': x, 'type': 'file', 'size': 6}
+                                       for x in names] +
+                                      [{'name': 'sub', 'type': 'dir', 'size': 0}]})
+        elif cmd[1] == 'transfer':
+            assert '--batch' in cmd
+            batch = kwargs['input'].decode('utf-8').splitlines()
+            assert all(x.startswith('--recursive ') for x in batch)
+            out = 'abc-123'
+        else:
+            raise subprocess.CalledProcessError(2, cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout=(out + '\n').encode('utf-8'))
+
+    return run, calls
+
+
+ITEMS = [download_icesm.TransferItem('TS', '/archive/TS/', '/dl'),
+         download_icesm.TransferItem('PS', '/archive/PS/', '/dl'),
+         download_icesm.TransferItem('SALT', '/archive/SALT/', '/dl')]
+
+
+def test_globustransfer_wait():
+    # PS and SALT are already at the destination. Globus skips PS and resends SALT.
+    polls = [('ACTIVE', 0, []),
+             ('ACTIVE', 0, ['/archive/TS/case.TS.nc']),
+             ('ACTIVE', 0, ['/archive/TS/case.TS.nc', '/archive/SALT/case.SALT.nc']),
+             ('ACTIVE', 1, ['/archive/TS/case.TS.nc', '/archive/SALT/case.SALT.nc']),
+             ('SUCCEEDED', 1, [])]
+    run, calls = fake_globus(polls, dest_files=['case.PS.nc', 'case.SALT.nc'])
+    backend = download_icesm.GlobusTransfer('from-ep', 'to-ep')
+    events = []
+
+    with mock.patch.object(download_icesm.subprocess, 'run', side_effect=run):
+        task = backend.submit(ITEMS, task_label='test')
+        ready = backend.wait(task, poll_interval=0,
+                             on_ready=lambda v: events.append((v, len(polls))))
+
+    assert task['task_id'] == 'abc-123'
+    assert ready == ['TS', 'SALT', 'PS']
+    # All are reported before the task succeeds.
+    assert events == [('TS', 3), ('SALT', 2), ('PS', 1)]
+    assert len([c for c in calls if c[1] == 'ls']) == 4
+
+
+def test_globustransfer_wait_succeeded():
+    polls = [('ACTIVE', 0, []), ('SUCCEEDED', 3, [])]
+    run, _ = fake_globus(polls, dest_files=['case.TS.nc', 'case.PS.nc', 'case.SALT.nc'])
+    backend = download_icesm.GlobusTransfer('from-ep', 'to-ep')
+
+    with mock.patch.object(download_icesm.subprocess, 'run', side_effect=run):
+        task = backend.submit(ITEMS)
+        ready = backend.wait(task, poll_interval=0)
+
+    assert ready == ['TS', 'PS', 'SALT']
+
+
+def test_globustransfer_wait_inactive(caplog):
+    polls = [('INACTIVE', 0, []), ('ACTIVE', 0, []), ('SUCCEEDED', 0, [])]
+    run, _ = fake_globus(polls)
+    backend = download_icesm.GlobusTransfer('from-ep', 'to-ep')
+
+    with mock.patch.object(download_icesm.subprocess, 'run', side_effect=run):
+        task = backend.submit(ITEMS[:1])
+        ready = backend.wait(task, poll_interval=0)
+
+    assert ready == ['TS']
+    assert 'abc-123 is paused' in caplog.text
+
+
+def test_globustransfer_wait_failed():
+    run, _ = fake_globus([('FAILED', 0, [])])
+    backend = download_icesm.GlobusTransfer('from-ep', 'to-ep')
+
+    with mock.patch.object(download_icesm.subprocess, 'run', side_effect=run):
+        task = backend.submit(ITEMS[:1])
+        with pytest.raises(RuntimeError):
+            backend.wait(task, poll_interval=0)